@@ -5,206 +5,1101 @@ Python data types.
 
 import copy
 import re
-from typing import Any, Dict, List, Union
+import threading
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
+_VARIABLE_REGEX = re.compile(r"\{\{ ?(\w+) ?\}\}", re.ASCII)
 
-class _NoReplacement:
+# Types of the template values that can not declare variables.
+_SCALAR_TYPES = frozenset((int, float, bool, type(None)))
+
+# Types of the template nodes that are rendered.
+_NODE_TYPES = frozenset((str, dict, list))
+
+# Number of items of a list template rendered by each task of an executor.
+_PARALLEL_CHUNK_SIZE = 256
+
+# Kinds of the slots of a compiled template: a key that declares variables, a
+# value that only declares a variable, a value with embedded variables rendered
+# with its format str and a value rendered with the RegEx.
+_KEY_SLOT, _VARIABLE_SLOT, _TEXT_SLOT, _VALUE_SLOT = range(4)
+
+# A list or dict of a template, keeping its type across a copy.
+_Node = TypeVar("_Node", List[Any], Dict[Any, Any])
+
+# Represents an empty value when there is no replacement.
+_NO_REPLACEMENT = object()
+
+# Types of the template values written as literals in the generated source code.
+_LITERAL_TYPES = frozenset((str, int, bool, type(None)))
+
+
+def _get_node_type(node: Any) -> type:
+    """
+    Obtains the type used to render a node that is a subclass of a rendered type.
+
+    Args:
+        node (Any): The template node.
+
+    Returns:
+        The str, dict or list type if the node is an instance of it, or its own type.
     """
-    Class for representing an empty type when there is no replacement.
+    for node_type in (str, dict, list):
+        if isinstance(node, node_type):
+            return node_type
+    return type(node)
+
+
+def _rebuild_node(prototype: _Node, items: _Node) -> _Node:
     """
+    Creates a container of the same type as a subclass of list or dict, such as an
+    OrderedDict or a defaultdict, holding the received items.
 
+    Args:
+        prototype (list | dict): The template container to copy the type from.
+        items (list | dict): The items of the new container.
 
-class Jsoninja:
+    Returns:
+        A copy of the prototype with the received items.
     """
-    Class that contains the necessary methods of Jsoninja.
+    node = copy.copy(prototype)
+    node.clear()
+    if isinstance(node, dict):
+        node.update(items)
+    else:
+        node.extend(items)
+    return node
+
+
+def _get_text_format(variable_regex: "re.Pattern[str]", variable: str) -> Optional[str]:
     """
+    Translates a str with embedded variables into a format str, so its replacement
+    is built by str.format_map in a single pass without the RegEx.
 
-    def __init__(self) -> None:
+    Args:
+        variable_regex (re.Pattern): The RegEx of the template variables.
+        variable (str): The template str that embeds variables.
+
+    Returns:
+        The format str or None if a variable name would be read as a positional
+        field, such as "{{1}}".
+    """
+    parts = []
+    position = 0
+    for match in variable_regex.finditer(variable):
+        var_name = match.group(1)
+        if var_name.isdigit():
+            return None
+        text = variable[position : match.start()]
+        parts.append(text.replace("{", "{{").replace("}", "}}"))
+        parts.append(f"{{{var_name}!s}}")
+        position = match.end()
+    text = variable[position:]
+    parts.append(text.replace("{", "{{").replace("}", "}}"))
+    return "".join(parts)
+
+
+class _Texts(Dict[str, str]):
+    """
+    Class that contains the str of the replacements embedded in other strs,
+    computing each one once when it is first requested.
+    """
+
+    __slots__ = ("replacements",)
+
+    def __init__(self, replacements: Dict[str, Any]) -> None:
         """
-        Initializes the instance with the variable RegEx.
+        Initializes the texts with the replacements of a single replace call.
+
+        Args:
+            replacements (dict): The values to be used as replacements.
         """
-        self.__variable_regex = re.compile(r"\{\{\ ?[a-zA-Z0-9_]+\ ?\}\}")
+        super().__init__()
+        self.replacements = replacements
 
-    def replace(
-        self,
-        template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
-        replacements: Dict[str, Any],
-    ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
+    def __missing__(self, var_name: str) -> str:
         """
-        Replaces the variables declared in the template.
+        Computes the str of a replacement.
 
         Args:
-            template (list | dict): Declares the template structure and variables.
-            replacements (dict): The values to be used as replacements.
+            var_name (str): The name of the template variable.
 
         Returns:
-            A list or a dict containing the template with the replaced values.
+            The str of the replacement.
 
         Raises:
-            ValueError: A template has not been loaded.
+            KeyError: The replacement is missing or is a callback, which is not
+                cached because it may change per declaration.
         """
-        if not template:
-            raise ValueError("A template has not been loaded.")
-        return self.__scan_template(copy.deepcopy(template), replacements)
+        replacement = self.replacements.get(var_name, _NO_REPLACEMENT)
+        if replacement is _NO_REPLACEMENT or callable(replacement):
+            raise KeyError(var_name)
+        text = self[var_name] = str(replacement)
+        return text
+
+
+class _Renderer:
+    """
+    Class that replaces the variables of templates with a set of replacements.
 
-    def __scan_template(
+    It assumes that none of the replacements is a callback, see _CallbackRenderer.
+    """
+
+    __slots__ = ("variable_regex", "replacements", "raise_on_missing", "texts")
+
+    def __init__(
         self,
-        template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
+        variable_regex: "re.Pattern[str]",
         replacements: Dict[str, Any],
-    ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
+        raise_on_missing: bool,
+    ) -> None:
         """
-        Checks if the first node of the template is a list or a dict.
+        Initializes the renderer with the replacements of a single replace call.
 
         Args:
-            template (list | dict): Declares the template structure and variables.
+            variable_regex (re.Pattern): The RegEx of the template variables.
             replacements (dict): The values to be used as replacements.
+            raise_on_missing (bool): Raise an exception for missing replacements.
+        """
+        self.variable_regex = variable_regex
+        self.replacements = replacements
+        self.raise_on_missing = raise_on_missing
+        # The str of the replacements embedded in other strs, computed once.
+        self.texts = _Texts(replacements)
+
+    def render(self, template: Union[List[Any], Dict[Any, Any]]) -> Any:
+        """
+        Builds a new template with the variables replaced, visiting each node once.
+
+        The nested lists and dicts are visited with an explicit stack instead of
+        recursion, so the depth of the template is not limited by the interpreter.
+
+        Args:
+            template (list | dict): Declares the template structure and variables.
 
         Returns:
             A list or a dict containing the template with the replaced values.
         """
-        if isinstance(template, list):
-            return self.__scan_list(template, replacements)
-        return self.__scan_dict(template, replacements)
+        render_key, render_value = self.render_key, self.render_value
+        # Each frame holds an iterator over the items of a template container, the
+        # container being built, whether its keys have to be replaced and the id of
+        # the template container. Lists are copied upfront, so only the items with
+        # variables have to be stored.
+        rendered: Union[List[Any], Dict[Any, Any]]
+        stack: List[Tuple[Iterator[Tuple[Any, Any]], Any, bool, int]]
+        # The ids of the containers being visited, to detect references to themselves.
+        path = {id(template)}
+        # Subclasses of dict and list are copied to keep their type.
+        if isinstance(template, dict):
+            rendered = {} if type(template) is dict else _rebuild_node(template, {})
+            stack = [(iter(template.items()), rendered, True, id(template))]
+        else:
+            rendered = list(template) if type(template) is list else copy.copy(template)
+            stack = [(enumerate(template), rendered, False, id(template))]
+        while stack:
+            items, node, is_dict, node_id = stack[-1]
+            for key, value in items:
+                # Static strs are recognized here, saving the calls to the render
+                # methods for the keys and values that do not declare variables.
+                if is_dict and isinstance(key, str) and "{{" in key:
+                    key = render_key(key)
+                value_type = type(value)
+                if value_type in _SCALAR_TYPES:
+                    if is_dict:
+                        node[key] = value
+                    continue
+                if value_type not in _NODE_TYPES:
+                    value_type = _get_node_type(value)
+                if value_type is str:
+                    if "{{" in value:
+                        node[key] = render_value(value)
+                    elif is_dict:
+                        node[key] = value
+                elif value_type is dict or value_type is list:
+                    if id(value) in path:
+                        raise ValueError("The template contains a reference to itself.")
+                    path.add(id(value))
+                    child: Any
+                    if value_type is dict:
+                        child = {}
+                        if type(value) is not dict:
+                            child = _rebuild_node(value, child)
+                        node[key] = child
+                        stack.append((iter(value.items()), child, True, id(value)))
+                    else:
+                        if type(value) is list:
+                            child = node[key] = list(value)
+                        else:
+                            child = node[key] = copy.copy(value)
+                        stack.append((enumerate(value), child, False, id(value)))
+                    break
+                elif is_dict:
+                    node[key] = value
+            else:
+                stack.pop()
+                path.remove(node_id)
+        return rendered
 
-    def __scan_list(
-        self, template: List[Dict[Any, Any]], replacements: Dict[str, Any]
-    ) -> List[Dict[Any, Any]]:
+    def render_parallel(self, template: List[Any], executor: Executor) -> List[Any]:
         """
-        Iterate over the list template.
+        Builds a new list with the variables of its items replaced, rendering chunks
+        of items in the tasks of an executor.
 
         Args:
             template (list): Declares the template structure and variables.
-            replacements (dict): The values to be used as replacements.
+            executor (Executor): The executor that runs the rendering tasks.
 
         Returns:
             A list containing the template with the replaced values.
         """
-        for index, dictionary in enumerate(template):
-            self.__scan_node(template, replacements, index, dictionary)
-        return template
+        if len(template) <= _PARALLEL_CHUNK_SIZE:
+            rendered: List[Any] = self.render(template)
+            return rendered
+        chunks = [
+            template[index : index + _PARALLEL_CHUNK_SIZE]
+            for index in range(0, len(template), _PARALLEL_CHUNK_SIZE)
+        ]
+        rendered = [
+            value for chunk in executor.map(self.render, chunks) for value in chunk
+        ]
+        if type(template) is not list:
+            return _rebuild_node(template, rendered)
+        return rendered
+
+    def render_inplace(self, template: Union[List[Any], Dict[Any, Any]]) -> None:
+        """
+        Replaces the variables of a template, reusing its lists and dicts.
+
+        The nested lists and dicts are visited with an explicit stack instead of
+        recursion, so the depth of the template is not limited by the interpreter.
+
+        Args:
+            template (list | dict): Declares the template structure and variables.
+        """
+        render_key, render_value = self.render_key, self.render_value
+        # Each frame holds a container, an iterator over its items and, for dicts,
+        # the keys to be renamed once all of its items have been visited.
+        stack: List[Tuple[Any, Iterator[Tuple[Any, Any]], Optional[Dict[Any, Any]]]]
+        # The ids of the containers being visited, to detect references to themselves.
+        path = {id(template)}
+        if isinstance(template, dict):
+            stack = [(template, iter(template.items()), {})]
+        else:
+            stack = [(template, enumerate(template), None)]
+        while stack:
+            node, items, key_replacements = stack[-1]
+            for key, value in items:
+                if (
+                    key_replacements is not None
+                    and isinstance(key, str)
+                    and "{{" in key
+                ):
+                    new_key = render_key(key)
+                    if new_key is not key:
+                        key_replacements[key] = new_key
+                value_type = type(value)
+                if value_type in _SCALAR_TYPES:
+                    continue
+                if value_type not in _NODE_TYPES:
+                    value_type = _get_node_type(value)
+                if value_type is str and "{{" in value:
+                    # Static strs are left in place instead of being stored again.
+                    rendered = render_value(value)
+                    if rendered is not value:
+                        node[key] = rendered
+                elif value_type is dict or value_type is list:
+                    if id(value) in path:
+                        raise ValueError("The template contains a reference to itself.")
+                    path.add(id(value))
+                    if value_type is dict:
+                        stack.append((value, iter(value.items()), {}))
+                    else:
+                        stack.append((value, enumerate(value), None))
+                    break
+            else:
+                stack.pop()
+                path.remove(id(node))
+                if key_replacements:
+                    node_items = list(node.items())
+                    node.clear()
+                    for key, value in node_items:
+                        node[key_replacements.get(key, key)] = value
+
+    def render_key(self, key: Any) -> Any:
+        """
+        Replaces the template variables declared in a key.
+
+        Args:
+            key (Any): The key of the node.
+
+        Returns:
+            The key with the replaced values.
+
+        Raises:
+            TypeError: Key replacement must be str, int, float or bool (...).
+        """
+        value = self.render_value(key)
+        if value is not key and not isinstance(value, (str, int, float, bool)):
+            match = self.variable_regex.search(key)
+            value_key = match.group(1) if match else key
+            raise TypeError(
+                f"Key replacement must be str, int, float or bool ({value_key})."
+            )
+        return value
+
+    def render_value(self, variable: Any) -> Any:
+        """
+        Obtains the replacement of a variable.
+
+        Args:
+            variable (Any): The template variable.
+
+        Returns:
+            The replacement of the variable or the variable itself if it has none.
+        """
+        replacement = self.get_replacement(variable)
+        if replacement is _NO_REPLACEMENT:
+            return variable
+        return replacement
+
+    def render_variable(self, var_name: str, variable: str) -> Any:
+        """
+        Obtains the replacement of a str that only declares a variable, using the
+        variable name extracted when the template was compiled.
+
+        Args:
+            var_name (str): The name of the template variable.
+            variable (str): The template variable.
+
+        Returns:
+            The replacement of the variable or the variable itself if it has none.
+
+        Raises:
+            KeyError: Unable to find a replacement for "...".
+        """
+        replacement = self.replacements.get(var_name, _NO_REPLACEMENT)
+        if replacement is _NO_REPLACEMENT:
+            if self.raise_on_missing:
+                raise KeyError(f'Unable to find a replacement for "{var_name}".')
+            return variable
+        return replacement
+
+    def render_text(self, variable: str, text_format: str) -> Any:
+        """
+        Obtains the replacement of a str with embedded variables using its format str.
+
+        Args:
+            variable (str): The template str that embeds variables.
+            text_format (str): The format str of the template str.
+
+        Returns:
+            The str with the replaced variables.
+        """
+        try:
+            return text_format.format_map(self.texts)
+        except KeyError:
+            # Missing replacements and callbacks are handled by the RegEx path.
+            return self.render_value(variable)
+
+    def get_replacement(self, variable: Any) -> Any:
+        """
+        Checks if the received variable is valid and then gets its replacement.
+
+        Args:
+            variable (Any): The template variable.
+
+        Returns:
+            The replacement associated for the template variable or _NO_REPLACEMENT.
+
+        Raises:
+            KeyError: Unable to find a replacement for "...".
+        """
+        if not isinstance(variable, str) or "{{" not in variable:
+            # Most strs are static text, a substring search rejects them without
+            # running the RegEx.
+            return _NO_REPLACEMENT
+        match = self.variable_regex.fullmatch(variable)
+        if match is not None:
+            # Fast path for the common case of a value declaring a single variable.
+            var_name = match.group(1)
+            replacement = self.replacements.get(var_name, _NO_REPLACEMENT)
+            if replacement is _NO_REPLACEMENT and self.raise_on_missing:
+                raise KeyError(f'Unable to find a replacement for "{var_name}".')
+            return replacement
+        replacement, count = self.variable_regex.subn(self.replace_match, variable)
+        if not count:
+            return _NO_REPLACEMENT
+        return replacement
+
+    def replace_match(self, match: "re.Match[str]") -> str:
+        """
+        Obtains the str replacement of a variable embedded in a str.
+
+        Args:
+            match (re.Match): The match of the template variable.
+
+        Returns:
+            A str with the replacement or the variable itself if it has none.
+
+        Raises:
+            KeyError: Unable to find a replacement for "...".
+        """
+        var_name = match.group(1)
+        text = self.texts.get(var_name)
+        if text is None:
+            replacement = self.replacements.get(var_name, _NO_REPLACEMENT)
+            if replacement is _NO_REPLACEMENT:
+                if self.raise_on_missing:
+                    raise KeyError(f'Unable to find a replacement for "{var_name}".')
+                return match.group(0)
+            text = self.get_text(var_name, replacement)
+        return text
+
+    def get_text(self, var_name: str, replacement: Any) -> str:
+        """
+        Obtains the str of a replacement embedded in a str, caching it for the rest
+        of its declarations.
+
+        Args:
+            var_name (str): The name of the template variable.
+            replacement (Any): The replacement of the template variable.
+
+        Returns:
+            The str of the replacement.
+        """
+        text = self.texts[var_name] = str(replacement)
+        return text
+
+
+class _CallbackRenderer(_Renderer):
+    """
+    Class that replaces the variables of templates with a set of replacements that
+    contains callbacks, calling them to generate the values to be replaced.
+    """
+
+    __slots__ = ()
+
+    def render_value(self, variable: Any) -> Any:
+        """
+        Obtains the replacement of a variable, calling it if it is a callback.
+
+        Args:
+            variable (Any): The template variable.
+
+        Returns:
+            The replacement of the variable or the variable itself if it has none.
+        """
+        if isinstance(variable, str) and "{{" in variable:
+            match = self.variable_regex.fullmatch(variable)
+            if match is not None:
+                return self.render_variable(match.group(1), variable)
+        # The variables embedded in strs are called by replace_match.
+        return super().render_value(variable)
+
+    def render_variable(self, var_name: str, variable: str) -> Any:
+        """
+        Obtains the replacement of a str that only declares a variable, calling it if
+        it is a callback.
 
-    def __scan_dict(
-        self, template: Dict[Any, Any], replacements: Dict[str, Any]
-    ) -> Dict[Any, Any]:
+        Args:
+            var_name (str): The name of the template variable.
+            variable (str): The template variable.
+
+        Returns:
+            The replacement of the variable or the variable itself if it has none.
+
+        Raises:
+            KeyError: Unable to find a replacement for "...".
+        """
+        replacement = super().render_variable(var_name, variable)
+        if callable(replacement):
+            return self.call_callback(var_name, replacement)
+        return replacement
+
+    def get_text(self, var_name: str, replacement: Any) -> str:
+        """
+        Obtains the str of a replacement embedded in a str, calling it if it is a
+        callback.
+
+        Args:
+            var_name (str): The name of the template variable.
+            replacement (Any): The replacement of the template variable.
+
+        Returns:
+            The str of the replacement.
+        """
+        if callable(replacement):
+            # The str of a callback is not cached, it may change per declaration.
+            return str(self.call_callback(var_name, replacement))
+        return super().get_text(var_name, replacement)
+
+    def call_callback(self, var_name: str, callback: Callable[[], Any]) -> Any:
+        """
+        Generates the value to be replaced for a declaration of a callback variable.
+
+        Args:
+            var_name (str): The name of the template variable.
+            callback (Callable): The callback of the replacements.
+
+        Returns:
+            The value returned by the callback.
+        """
+        return callback()
+
+
+class _CachedCallbackRenderer(_CallbackRenderer):
+    """
+    Class that replaces the variables of templates with a set of replacements that
+    contains callbacks, calling the callback of each variable only once for all
+    declarations of that variable.
+    """
+
+    __slots__ = ("results", "lock")
+
+    def __init__(
+        self,
+        variable_regex: "re.Pattern[str]",
+        replacements: Dict[str, Any],
+        raise_on_missing: bool,
+    ) -> None:
         """
-        Iterate over the dict template and stores the key replacements to be replaced.
+        Initializes the renderer with the replacements of a single replace call.
 
         Args:
-            template (dict): Declares the template structure and variables.
+            variable_regex (re.Pattern): The RegEx of the template variables.
             replacements (dict): The values to be used as replacements.
+            raise_on_missing (bool): Raise an exception for missing replacements.
+        """
+        super().__init__(variable_regex, replacements, raise_on_missing)
+        # The values returned by the callbacks, by the name of their variable, so
+        # a callback shared by several variables is called once for each of them.
+        self.results: Dict[str, Any] = {}
+        # Guards the results when the template is rendered by a thread pool.
+        self.lock = threading.Lock()
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """
+        Pickles the renderer for a process pool without its results and lock, each
+        task calls the callbacks of its own copy once.
 
         Returns:
-            A dict containing the template with the replaced values.
+            The class of the renderer and the arguments to create a new one.
         """
-        key_replacements: Dict[str, Any] = {}
-        for key, value in template.items():
-            self.__apply_replacement(key_replacements, replacements, key, key)
-            self.__scan_node(template, replacements, key, value)
-        self.__replace_keys(template, key_replacements)
-        return template
+        return (
+            type(self),
+            (self.variable_regex, self.replacements, self.raise_on_missing),
+        )
+
+    def call_callback(self, var_name: str, callback: Callable[[], Any]) -> Any:
+        """
+        Generates the value to be replaced for a callback variable, reusing the value
+        returned by the callback if the variable has already been replaced.
+
+        Args:
+            var_name (str): The name of the template variable.
+            callback (Callable): The callback of the replacements.
 
-    def __scan_node(
+        Returns:
+            The value returned by the callback.
+        """
+        result = self.results.get(var_name, _NO_REPLACEMENT)
+        if result is _NO_REPLACEMENT:
+            with self.lock:
+                result = self.results.get(var_name, _NO_REPLACEMENT)
+                if result is _NO_REPLACEMENT:
+                    result = self.results[var_name] = callback()
+        return result
+
+
+def _get_renderer(
+    variable_regex: "re.Pattern[str]",
+    replacements: Dict[str, Any],
+    raise_on_missing: bool,
+    cache_callbacks: bool,
+) -> _Renderer:
+    """
+    Creates the renderer for the replacements, only checking if a replacement is a
+    callback when at least one of them is.
+
+    Args:
+        variable_regex (re.Pattern): The RegEx of the template variables.
+        replacements (dict): The values to be used as replacements.
+        raise_on_missing (bool): Raise an exception for missing replacements.
+        cache_callbacks (bool): Call the callback of each variable only once.
+
+    Returns:
+        A renderer specialized for the received replacements.
+    """
+    if not any(callable(value) for value in replacements.values()):
+        return _Renderer(variable_regex, replacements, raise_on_missing)
+    if cache_callbacks:
+        return _CachedCallbackRenderer(variable_regex, replacements, raise_on_missing)
+    return _CallbackRenderer(variable_regex, replacements, raise_on_missing)
+
+
+class CompiledTemplate:
+    """
+    Class that contains a template analyzed once to be replaced many times.
+
+    Only the lists and dicts of the template are copied and only the keys and
+    values that declare variables are replaced in each call, the rest of the
+    template is not visited again.
+    """
+
+    __slots__ = ("__variable_regex", "__containers", "__slots")
+
+    def __init__(
         self,
+        variable_regex: "re.Pattern[str]",
         template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
-        replacements: Dict[str, Any],
-        key: Any,
-        value: Any,
     ) -> None:
         """
-        Replace the node variables with the corresponding replacements.
+        Initializes the instance finding the variables declared in the template.
+
+        The template is visited in the same order as Jsoninja.replace, so the
+        callbacks are called in the same order for all of its declarations.
 
         Args:
+            variable_regex (re.Pattern): The RegEx of the template variables.
             template (list | dict): Declares the template structure and variables.
+        """
+        self.__variable_regex = variable_regex
+        # The lists and dicts of the template, each one after its parent, with the
+        # index of the parent, the key in the parent, a copy of the container and
+        # the function that copies it keeping its type.
+        self.__containers: List[
+            Tuple[int, Any, Union[List[Any], Dict[Any, Any]], Callable[[Any], Any]]
+        ] = []
+        # The keys and values that declare variables, in the order they are
+        # rendered, with their kind, the index of their container, their key, the
+        # template str and the variable name or the format str of a value.
+        self.__slots: List[Tuple[int, int, Any, str, Any]] = []
+        containers, slots = self.__containers, self.__slots
+        search = variable_regex.search
+        fullmatch = variable_regex.fullmatch
+        # Each frame holds an iterator over the items of a template container, its
+        # index, whether its keys may declare variables and its id. The container
+        # to be entered is held with the index of its parent and its key there.
+        stack: List[Tuple[Iterator[Tuple[Any, Any]], int, bool, int]] = []
+        child: Optional[Tuple[int, Any, Any]] = (-1, None, template)
+        # The ids of the containers being visited, to detect references to themselves.
+        path: Set[int] = set()
+        while True:
+            if child is not None:
+                parent, parent_key, node = child
+                child = None
+                if id(node) in path:
+                    raise ValueError("The template contains a reference to itself.")
+                path.add(id(node))
+                copy_node: Callable[[Any], Any] = copy.copy
+                if type(node) is dict:
+                    copy_node = dict.copy
+                elif type(node) is list:
+                    copy_node = list.copy
+                containers.append((parent, parent_key, copy_node(node), copy_node))
+                if isinstance(node, dict):
+                    stack.append(
+                        (iter(node.items()), len(containers) - 1, True, id(node))
+                    )
+                else:
+                    stack.append(
+                        (enumerate(node), len(containers) - 1, False, id(node))
+                    )
+            if not stack:
+                break
+            items, index, is_dict, node_id = stack[-1]
+            for key, value in items:
+                if is_dict and isinstance(key, str) and search(key):
+                    slots.append((_KEY_SLOT, index, key, key, None))
+                value_type = type(value)
+                if value_type in _SCALAR_TYPES:
+                    continue
+                if value_type not in _NODE_TYPES:
+                    value_type = _get_node_type(value)
+                if value_type is str:
+                    match = fullmatch(value)
+                    if match is not None:
+                        slots.append(
+                            (_VARIABLE_SLOT, index, key, value, match.group(1))
+                        )
+                    elif search(value):
+                        text_format = _get_text_format(variable_regex, value)
+                        if text_format is None:
+                            slots.append((_VALUE_SLOT, index, key, value, None))
+                        else:
+                            slots.append((_TEXT_SLOT, index, key, value, text_format))
+                elif value_type is dict or value_type is list:
+                    child = (index, key, value)
+                    break
+            else:
+                stack.pop()
+                path.remove(node_id)
+
+    def render(
+        self,
+        replacements: Dict[str, Any],
+        *,
+        raise_on_missing: bool = True,
+        cache_callbacks: bool = False,
+    ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
+        """
+        Replaces the variables declared in the template.
+
+        Args:
             replacements (dict): The values to be used as replacements.
-            key (Any): The key of the node.
-            value (Any): The value of the node.
+            raise_on_missing (bool): Raise an exception when a variable has no
+                replacement instead of leaving its declaration untouched.
+            cache_callbacks (bool): Call the callback of each variable once and reuse
+                its value for all declarations of that variable instead of calling
+                it for each of them.
+
+        Returns:
+            A list or a dict containing the template with the replaced values.
+        """
+        renderer = _get_renderer(
+            self.__variable_regex, replacements, raise_on_missing, cache_callbacks
+        )
+        render_key = renderer.render_key
+        render_value = renderer.render_value
+        render_variable = renderer.render_variable
+        render_text = renderer.render_text
+        nodes: List[Any] = []
+        for parent, parent_key, container, copy_node in self.__containers:
+            node = copy_node(container)
+            if parent >= 0:
+                nodes[parent][parent_key] = node
+            nodes.append(node)
+        # The replaced keys of each dict, applied once all of its items are set.
+        renames: Dict[int, Dict[Any, Any]] = {}
+        for kind, index, key, variable, argument in self.__slots:
+            if kind == _VARIABLE_SLOT:
+                nodes[index][key] = render_variable(argument, variable)
+            elif kind == _TEXT_SLOT:
+                nodes[index][key] = render_text(variable, argument)
+            elif kind == _VALUE_SLOT:
+                nodes[index][key] = render_value(variable)
+            else:
+                renames.setdefault(index, {})[key] = render_key(key)
+        for index, keys in renames.items():
+            renamed: Dict[Any, Any] = nodes[index]
+            node_items = list(renamed.items())
+            renamed.clear()
+            for key, value in node_items:
+                renamed[keys.get(key, key)] = value
+        rendered: Union[List[Dict[Any, Any]], Dict[Any, Any]] = nodes[0]
+        return rendered
+
+
+def _generate_source(
+    variable_regex: "re.Pattern[str]",
+    template: Union[List[Any], Dict[Any, Any]],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Generates the source code of a function that builds the template, receiving the
+    functions that render its values, keys, strs with embedded variables and strs
+    that only declare a variable.
+
+    Args:
+        variable_regex (re.Pattern): The RegEx of the template variables.
+        template (list | dict): Declares the template structure and variables.
+
+    Returns:
+        The source code of the function and the constants that it references.
+    """
+    search = variable_regex.search
+    constants: Dict[str, Any] = {}
+
+    def get_literal(value: Any) -> str:
+        """
+        Obtains the source code that evaluates to a value of the template.
+
+        Args:
+            value (Any): The value of the template.
+
+        Returns:
+            The literal of the value or the name of the constant that holds it.
         """
-        if isinstance(value, list):
-            self.__scan_list(value, replacements)
-        elif isinstance(value, dict):
-            template[key] = self.__scan_dict(value, replacements)
+        if type(value) in _LITERAL_TYPES:
+            try:
+                return repr(value)
+            except ValueError:
+                # Ints longer than the int max str digits limit can not be written.
+                pass
+        # Values without an exact literal, such as floats, subclasses or long ints,
+        # are passed as constants to keep them untouched.
+        name = f"_c{len(constants)}"
+        constants[name] = value
+        return name
+
+    source = ["def _render(v, k, t, n):\n    return "]
+    # Pending source code to write, with the id of the container that it closes,
+    # or pending nodes of the template without source code.
+    stack: List[Tuple[Optional[str], Any]] = [(None, template)]
+    # The ids of the containers being written, to detect references to themselves.
+    path: Set[int] = set()
+    while stack:
+        text, node = stack.pop()
+        if text is not None:
+            source.append(text)
+            if node is not None:
+                path.remove(node)
+            continue
+        node_type = type(node)
+        if node_type not in _SCALAR_TYPES and node_type not in _NODE_TYPES:
+            node_type = _get_node_type(node)
+        if node_type is str:
+            literal = get_literal(node)
+            match = variable_regex.fullmatch(node)
+            if match is not None:
+                literal = f"n({match.group(1)!r}, {literal})"
+            elif search(node):
+                text_format = _get_text_format(variable_regex, node)
+                if text_format is None:
+                    literal = f"v({literal})"
+                else:
+                    literal = f"t({literal}, {get_literal(text_format)})"
+            source.append(literal)
+        elif node_type is dict or node_type is list:
+            if id(node) in path:
+                raise ValueError("The template contains a reference to itself.")
+            path.add(id(node))
+            opening, closing = ("{", "}") if node_type is dict else ("[", "]")
+            if type(node) is not node_type:
+                # Subclasses of dict and list are rebuilt to keep their type.
+                constants["_rebuild"] = _rebuild_node
+                opening = f"_rebuild({get_literal(node)}, {opening}"
+                closing = f"{closing})"
+            items: List[Tuple[Optional[str], Any]] = [(opening, None)]
+            if node_type is dict:
+                for key, value in node.items():
+                    literal = get_literal(key)
+                    if isinstance(key, str) and search(key):
+                        literal = f"k({literal})"
+                    items += [(f"{literal}: ", None), (None, value), (", ", None)]
+            else:
+                for value in node:
+                    items += [(None, value), (", ", None)]
+            items.append((closing, id(node)))
+            stack.extend(reversed(items))
         else:
-            self.__apply_replacement(template, replacements, key, value)
+            source.append(get_literal(node))
+    source.append("\n")
+    return "".join(source), constants
+
+
+class Jsoninja:
+    """
+    Class that contains the necessary methods of Jsoninja.
+    """
+
+    __slots__ = ("__variable_regex",)
+
+    def __init__(self) -> None:
+        """
+        Initializes the instance with the variable RegEx.
+        """
+        self.__variable_regex = _VARIABLE_REGEX
 
-    def __apply_replacement(
+    def replace(
         self,
-        structure: Union[List[Dict[Any, Any]], Dict[Any, Any]],
+        template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
         replacements: Dict[str, Any],
-        key: Any,
-        variable: Any,
-    ) -> None:
+        *,
+        raise_on_missing: bool = True,
+        cache_callbacks: bool = False,
+        executor: Optional[Executor] = None,
+    ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
         """
-        Obtains the replacement of a variable and applies it to the structure.
+        Replaces the variables declared in the template.
 
         Args:
-            structure (list | dict): Declares the structure and variables.
+            template (list | dict): Declares the template structure and variables.
             replacements (dict): The values to be used as replacements.
-            key (Any): The key of the node.
-            variable (Any): The template variable.
+            raise_on_missing (bool): Raise an exception when a variable has no
+                replacement instead of leaving its declaration untouched.
+            cache_callbacks (bool): Call the callback of each variable once and reuse
+                its value for all declarations of that variable instead of calling
+                it for each of them.
+            executor (Executor): Renders the items of a list template in parallel
+                chunks. A process pool requires picklable templates and
+                replacements, and each process calls its own copy of the callbacks,
+                so cache_callbacks calls them once per task instead of once.
+
+        Returns:
+            A list or a dict containing the template with the replaced values.
+
+        Raises:
+            ValueError: A template has not been loaded.
+            ValueError: The template contains a reference to itself.
         """
-        replacement = self.__get_replacement(variable, replacements)
-        if not isinstance(replacement, _NoReplacement):
-            if callable(replacement):
-                structure[key] = replacement()
-            else:
-                structure[key] = replacement
+        if not template:
+            raise ValueError("A template has not been loaded.")
+        renderer = _get_renderer(
+            self.__variable_regex, replacements, raise_on_missing, cache_callbacks
+        )
+        if executor is not None and isinstance(template, list):
+            return renderer.render_parallel(template, executor)
+        rendered: Union[List[Dict[Any, Any]], Dict[Any, Any]] = renderer.render(
+            template
+        )
+        return rendered
 
-    def __get_replacement(self, variable: Any, replacements: Dict[str, Any]) -> Any:
+    def replace_inplace(
+        self,
+        template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
+        replacements: Dict[str, Any],
+        *,
+        raise_on_missing: bool = True,
+        cache_callbacks: bool = False,
+    ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
         """
-        Checks if the received variable is valid and then gets its replacement.
+        Replaces the variables declared in the template, modifying the template.
+
+        The lists and dicts of the template are reused instead of copied, so the
+        returned value is the template itself and it can not be used as a template
+        again. If an exception is raised, the template may be partially replaced.
 
         Args:
-            variable (Any): The template variable.
+            template (list | dict): Declares the template structure and variables.
             replacements (dict): The values to be used as replacements.
+            raise_on_missing (bool): Raise an exception when a variable has no
+                replacement instead of leaving its declaration untouched.
+            cache_callbacks (bool): Call the callback of each variable once and reuse
+                its value for all declarations of that variable instead of calling
+                it for each of them.
 
         Returns:
-            The replacement associated for the template variable or None.
+            The received template with the replaced values.
 
         Raises:
-            KeyError: Unable to find a replacement for "...".
+            ValueError: A template has not been loaded.
+            ValueError: The template contains a reference to itself.
         """
-        replacement: Any = _NoReplacement()
-        matches = self.__variable_regex.finditer(str(variable))
-        for match in matches:
-            var_name = self.__clean_variable(match.group(0))
-            if var_name not in replacements:
-                raise KeyError(f'Unable to find a replacement for "{var_name}".')
-            if match.group(0) == variable:
-                return replacements[var_name]
-            if isinstance(replacement, _NoReplacement):
-                replacement = variable
-            replacement = replacement.replace(match.group(0), replacements[var_name])
-        return replacement
+        if not template:
+            raise ValueError("A template has not been loaded.")
+        renderer = _get_renderer(
+            self.__variable_regex, replacements, raise_on_missing, cache_callbacks
+        )
+        renderer.render_inplace(template)
+        return template
 
-    def __clean_variable(self, variable: str) -> str:
+    def compile(
+        self, template: Union[List[Dict[Any, Any]], Dict[Any, Any]]
+    ) -> CompiledTemplate:
         """
-        Removes the brackets that declare the template variable.
+        Analyzes the template once to replace its variables many times.
 
         Args:
-            variable (str): The template variable.
+            template (list | dict): Declares the template structure and variables.
 
         Returns:
-            A str with the template variable name without the brackets.
+            A CompiledTemplate to be rendered with different replacements.
+
+        Raises:
+            ValueError: A template has not been loaded.
+            ValueError: The template contains a reference to itself.
         """
-        return variable[2:-2].strip()
+        if not template:
+            raise ValueError("A template has not been loaded.")
+        return CompiledTemplate(self.__variable_regex, template)
 
-    def __replace_keys(
-        self, template: Dict[Any, Any], replacements: Dict[str, Any]
-    ) -> None:
+    def compile_to_fn(
+        self,
+        template: Union[List[Dict[Any, Any]], Dict[Any, Any]],
+        *,
+        raise_on_missing: bool = True,
+        cache_callbacks: bool = False,
+    ) -> Callable[[Dict[str, Any]], Union[List[Dict[Any, Any]], Dict[Any, Any]]]:
         """
-        Replaces the template variables declared in the keys.
+        Generates a Python function that builds the template, so only the keys and
+        values that declare variables are replaced in each call.
+
+        Templates nested deeper than the Python parser allows are rendered with a
+        CompiledTemplate instead.
 
         Args:
-            template (dict): Declares the template structure and variables.
-            replacements (dict): The values to be used as replacements.
+            template (list | dict): Declares the template structure and variables.
+            raise_on_missing (bool): Raise an exception when a variable has no
+                replacement instead of leaving its declaration untouched.
+            cache_callbacks (bool): Call the callback of each variable once and reuse
+                its value for all declarations of that variable instead of calling
+                it for each of them.
+
+        Returns:
+            A function that receives the replacements and returns a list or a dict
+            containing the template with the replaced values.
 
         Raises:
-            TypeError: Key replacement must be str, int, float or bool (...).
+            ValueError: A template has not been loaded.
+            ValueError: The template contains a reference to itself.
         """
-        for variable, value in replacements.items():
-            if not isinstance(value, (str, int, float, bool)):
-                value_key = self.__clean_variable(variable)
-                raise TypeError(
-                    f"Key replacement must be str, int, float or bool ({value_key})."
+        if not template:
+            raise ValueError("A template has not been loaded.")
+        variable_regex = self.__variable_regex
+        source, namespace = _generate_source(variable_regex, template)
+        try:
+            code = compile(source, "<jsoninja>", "exec")
+        except (RecursionError, SyntaxError, MemoryError):
+            compiled = CompiledTemplate(variable_regex, template)
+
+            def render_compiled(
+                replacements: Dict[str, Any],
+            ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
+                """
+                Replaces the variables declared in the compiled template.
+
+                Args:
+                    replacements (dict): The values to be used as replacements.
+
+                Returns:
+                    A list or a dict containing the template with the replaced
+                    values.
+                """
+                return compiled.render(
+                    replacements,
+                    raise_on_missing=raise_on_missing,
+                    cache_callbacks=cache_callbacks,
                 )
-            template[value] = template.pop(variable)
+
+            return render_compiled
+        namespace["__builtins__"] = {}
+        exec(code, namespace)
+        build_template = namespace["_render"]
+
+        def render(
+            replacements: Dict[str, Any],
+        ) -> Union[List[Dict[Any, Any]], Dict[Any, Any]]:
+            """
+            Replaces the variables declared in the template with the generated
+            function.
+
+            Args:
+                replacements (dict): The values to be used as replacements.
+
+            Returns:
+                A list or a dict containing the template with the replaced values.
+            """
+            renderer = _get_renderer(
+                variable_regex, replacements, raise_on_missing, cache_callbacks
+            )
+            rendered: Union[List[Dict[Any, Any]], Dict[Any, Any]] = build_template(
+                renderer.render_value,
+                renderer.render_key,
+                renderer.render_text,
+                renderer.render_variable,
+            )
+            return rendered
+
+        return render
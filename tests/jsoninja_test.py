@@ -3,7 +3,14 @@ Jsoninja is a library that allows you to generate JSON's from templates written
 Python data types.
 """
 
+import copy
+import itertools
 import re
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
 
 import pytest
 
@@ -58,6 +65,32 @@ def test_returns_new_dict_object() -> None:
     assert jsoninja.replace(template, replacements) != template
 
 
+def test_template_is_not_modified() -> None:
+    """
+    Tests that the nested structures of the template are not modified.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "{{key}}": [
+            {
+                "foo": "{{foo}}",
+            },
+        ],
+    }
+    replacements = {
+        "key": "bar",
+        "foo": "bar",
+    }
+    jsoninja.replace(template, replacements)
+    assert template == {
+        "{{key}}": [
+            {
+                "foo": "{{foo}}",
+            },
+        ],
+    }
+
+
 def test_variable_declarations() -> None:
     """
     Tests that the different types of variable declarations work correctly.
@@ -86,6 +119,145 @@ def test_variable_declarations() -> None:
     assert jsoninja.replace(template, replacements) == expected
 
 
+def test_embedded_variables() -> None:
+    """
+    Tests that the variables embedded in a str are replaced with the str of their
+    replacement values, without replacing the variables declared in those values.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "summary": "{{name}} is {{age}} years old ({{married}})",
+        "nested": "{{a}}{{b}}",
+        "callback": "id-{{id}}",
+    }
+    replacements = {
+        "name": "John",
+        "age": 25,
+        "married": False,
+        "a": "{{b}}",
+        "b": "bar",
+        "id": lambda: 1,
+    }
+    expected = {
+        "summary": "John is 25 years old (False)",
+        "nested": "{{b}}bar",
+        "callback": "id-1",
+    }
+    assert jsoninja.replace(template, replacements) == expected
+
+
+def test_container_subclasses() -> None:
+    """
+    Tests that the variables declared in subclasses of dict, list and str are
+    replaced, keeping the type of the dicts and lists.
+    """
+
+    class CustomList(list):  # type: ignore[type-arg]
+        pass
+
+    class CustomStr(str):
+        pass
+
+    jsoninja = Jsoninja()
+    template = OrderedDict(
+        [
+            ("foo", CustomList([CustomStr("{{foo}}")])),
+            ("counts", defaultdict(int, {"{{foo}}": 1})),
+        ]
+    )
+    replacements = {
+        "foo": "bar",
+    }
+    expected = {
+        "foo": ["bar"],
+        "counts": {"bar": 1},
+    }
+    results: List[Any] = [
+        jsoninja.replace(template, replacements),
+        jsoninja.compile(template).render(replacements),
+        jsoninja.compile_to_fn(template)(replacements),
+    ]
+    for result in results:
+        assert result == expected
+        assert type(result) is OrderedDict
+        assert type(result["foo"]) is CustomList
+        assert type(result["counts"]) is defaultdict
+        assert result["counts"]["missing"] == 0
+    assert template["foo"] == ["{{foo}}"]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result = jsoninja.replace(
+            CustomList([{"foo": "{{foo}}"}] * 1000), replacements, executor=executor
+        )
+    assert type(result) is CustomList
+    assert result == [{"foo": "bar"}] * 1000
+
+
+def test_invalid_variable_declarations() -> None:
+    """
+    Tests that the invalid variable declarations are not replaced.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "declaration1": "{{  foo  }}",
+        "declaration2": "{{foo-bar}}",
+        "declaration3": "{{}}",
+        "declaration4": "{foo}",
+        "{{ }}": "declaration5",
+    }
+    replacements = {
+        "foo": "bar",
+    }
+    assert jsoninja.replace(template, replacements) == template
+
+
+def test_key_replacement_order() -> None:
+    """
+    Tests that the replaced keys keep their position in the dict.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "first": 1,
+        "{{second}}": 2,
+        "third": 3,
+    }
+    replacements = {
+        "second": "second",
+    }
+    assert list(jsoninja.replace(template, replacements)) == [
+        "first",
+        "second",
+        "third",
+    ]
+    assert list(jsoninja.replace_inplace(template, replacements)) == [
+        "first",
+        "second",
+        "third",
+    ]
+
+
+def test_key_replacement_collision() -> None:
+    """
+    Tests that the last key in template order wins when a replaced key collides
+    with another key of the dict, keeping the position of the first one.
+    """
+    jsoninja = Jsoninja()
+    replacements = {
+        "key": "x",
+    }
+    for template, expected in (
+        ({"{{key}}": 1, "x": 2, "y": 3}, [("x", 2), ("y", 3)]),
+        ({"y": 3, "x": 2, "{{key}}": 1}, [("y", 3), ("x", 1)]),
+    ):
+        results: List[Any] = [
+            jsoninja.replace(template, replacements),
+            jsoninja.compile(template).render(replacements),
+            jsoninja.compile_to_fn(template)(replacements),
+            jsoninja.replace_inplace(dict(template), replacements),
+        ]
+        for result in results:
+            assert list(result.items()) == expected
+
+
 def test_key_replacement_type() -> None:
     """
     Tests that an exception is raised when the replacement value is not a valid type.
@@ -179,6 +351,111 @@ def test_callback_functions() -> None:
     assert jsoninja.replace(template, replacements) == expected
 
 
+def test_callback_functions_called_per_declaration() -> None:
+    """
+    Tests that callback functions are called for each declaration of the variable.
+    """
+    counter = iter(range(1, 10))
+
+    jsoninja = Jsoninja()
+    template = {
+        "first": "{{id}}",
+        "second": "{{id}}-{{id}}",
+        "name": "{{name}}-{{name}}",
+    }
+    replacements = {
+        "id": lambda: next(counter),
+        "name": "foo",
+    }
+    expected = {
+        "first": 1,
+        "second": "2-3",
+        "name": "foo-foo",
+    }
+    assert jsoninja.replace(template, replacements) == expected
+
+
+def test_cached_callback_functions() -> None:
+    """
+    Tests that callback functions are called only once when caching them.
+    """
+    counter = iter(range(1, 10))
+
+    jsoninja = Jsoninja()
+    template = {
+        "first": "{{id}}",
+        "second": "{{id}}-{{id}}",
+        "{{id}}": "{{id}}",
+    }
+    replacements = {
+        "id": lambda: next(counter),
+    }
+    expected = {
+        "first": 1,
+        "second": "1-1",
+        1: 1,
+    }
+    assert jsoninja.replace(template, replacements, cache_callbacks=True) == expected
+    assert jsoninja.replace(template, replacements, cache_callbacks=True) == {
+        "first": 2,
+        "second": "2-2",
+        2: 2,
+    }
+
+
+def test_cached_callback_functions_per_variable() -> None:
+    """
+    Tests that a callback function shared by several variables is called once for
+    each of them when caching them.
+    """
+    counter = iter(range(1, 10))
+
+    def callback() -> int:
+        return next(counter)
+
+    jsoninja = Jsoninja()
+    template = {
+        "id1": "{{id1}}",
+        "id2": "{{id2}}",
+        "ids": "{{id1}}-{{id2}}",
+    }
+    replacements = {
+        "id1": callback,
+        "id2": callback,
+    }
+    expected = {
+        "id1": 1,
+        "id2": 2,
+        "ids": "1-2",
+    }
+    assert jsoninja.replace(template, replacements, cache_callbacks=True) == expected
+
+
+def test_cached_callback_functions_with_executor() -> None:
+    """
+    Tests that callback functions are called only once when caching them and
+    replacing the template with a thread pool.
+    """
+    calls: List[int] = []
+
+    def callback() -> int:
+        calls.append(len(calls))
+        time.sleep(0.01)
+        return len(calls)
+
+    jsoninja = Jsoninja()
+    template = [{"id": "{{id}}"} for _ in range(2000)]
+    replacements = {
+        "id": callback,
+    }
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        result = jsoninja.replace(
+            template, replacements, cache_callbacks=True, executor=executor
+        )
+    assert calls == [0]
+    assert result == [{"id": 1} for _ in range(2000)]
+
+
 def test_full_replacement_flow() -> None:
     """
     Tests a complete replacement flow.
@@ -247,3 +524,374 @@ def test_full_replacement_flow() -> None:
         ],
     }
     assert jsoninja.replace(template, replacements) == expected
+
+
+def test_ignore_missing_replacements() -> None:
+    """
+    Tests that the variables without replacement value are not replaced when the
+    missing replacements are ignored.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "firstname": "{{firstname}}",
+        "lastname": "{{lastname}}",
+        "fullname": "{{firstname}} {{lastname}}",
+        "{{lastname}}": "lastname",
+    }
+    replacements = {
+        "firstname": "John",
+    }
+    expected = {
+        "firstname": "John",
+        "lastname": "{{lastname}}",
+        "fullname": "John {{lastname}}",
+        "{{lastname}}": "lastname",
+    }
+    assert jsoninja.replace(template, replacements, raise_on_missing=False) == expected
+
+
+def test_no_template_received_inplace() -> None:
+    """
+    Tests that an exception is raised when the template to be modified is not
+    received.
+    """
+    jsoninja = Jsoninja()
+    with pytest.raises(ValueError, match=re.escape("A template has not been loaded.")):
+        jsoninja.replace_inplace({}, {})
+
+
+def test_replace_inplace() -> None:
+    """
+    Tests that the template is modified and returned when replacing in place.
+    """
+    jsoninja = Jsoninja()
+    pets = [
+        {
+            "name": "{{pet}}",
+            "type": "fish",
+        },
+    ]
+    template = {
+        "firstname": "{{name}}",
+        "{{key}}": "Doe",
+        "age": 25,
+        "pets": pets,
+    }
+    replacements = {
+        "name": "John",
+        "key": "lastname",
+        "pet": "Qwerty",
+    }
+    expected = {
+        "firstname": "John",
+        "lastname": "Doe",
+        "age": 25,
+        "pets": [
+            {
+                "name": "Qwerty",
+                "type": "fish",
+            },
+        ],
+    }
+    result = jsoninja.replace_inplace(template, replacements)
+    assert result is template
+    assert result == expected
+    assert list(result) == ["firstname", "lastname", "age", "pets"]
+    assert template["pets"] is pets
+
+
+def test_deep_template() -> None:
+    """
+    Tests that templates deeper than the recursion limit can be replaced.
+    """
+    jsoninja = Jsoninja()
+    template: List[Any] = ["{{foo}}"]
+    for _ in range(sys.getrecursionlimit() * 2):
+        template = [template]
+    replacements = {
+        "foo": "bar",
+    }
+    node: Any = jsoninja.replace(template, replacements)
+    while isinstance(node[0], list):
+        node = node[0]
+    assert node == ["bar"]
+
+
+def test_replace_inplace_deep_template() -> None:
+    """
+    Tests that templates deeper than the recursion limit can be replaced in place.
+    """
+    jsoninja = Jsoninja()
+    template: List[Any] = ["{{foo}}"]
+    for _ in range(sys.getrecursionlimit() * 2):
+        template = [template]
+    replacements = {
+        "foo": "bar",
+    }
+    node: Any = jsoninja.replace_inplace(template, replacements)
+    while isinstance(node[0], list):
+        node = node[0]
+    assert node == ["bar"]
+
+
+def test_self_referencing_template() -> None:
+    """
+    Tests that an exception is raised when the template contains a reference to
+    itself, and that containers shared by several nodes are replaced.
+    """
+    jsoninja = Jsoninja()
+    template: Any = {"foo": "{{foo}}", "items": []}
+    template["items"].append({"parent": template})
+    replacements = {
+        "foo": "bar",
+    }
+    for replace in (
+        jsoninja.replace,
+        jsoninja.replace_inplace,
+        lambda template, replacements: jsoninja.compile(template),
+        lambda template, replacements: jsoninja.compile_to_fn(template),
+    ):
+        with pytest.raises(ValueError) as exception:
+            replace(template, replacements)
+        assert str(exception.value) == "The template contains a reference to itself."
+    shared = ["{{foo}}"]
+    template = {"first": shared, "second": [shared]}
+    expected = {"first": ["bar"], "second": [["bar"]]}
+    assert jsoninja.replace(template, replacements) == expected
+    assert jsoninja.compile(template).render(replacements) == expected
+    assert jsoninja.compile_to_fn(template)(replacements) == expected
+    assert jsoninja.replace_inplace(template, replacements) == expected
+
+
+def test_parallel_replacement() -> None:
+    """
+    Tests that the items of a list template are replaced in order using an executor.
+    """
+    jsoninja = Jsoninja()
+    template = [
+        {
+            "id": index,
+            "name": "{{name}}",
+        }
+        for index in range(1000)
+    ]
+    replacements = {
+        "name": "John",
+    }
+    expected = [
+        {
+            "id": index,
+            "name": "John",
+        }
+        for index in range(1000)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        result = jsoninja.replace(template, replacements, executor=executor)
+    assert result == expected
+
+
+def test_no_template_received_compile() -> None:
+    """
+    Tests that an exception is raised when the template to compile is not received.
+    """
+    jsoninja = Jsoninja()
+    with pytest.raises(ValueError) as exception:
+        jsoninja.compile({})
+    assert str(exception.value) == "A template has not been loaded."
+
+
+def test_compiled_template() -> None:
+    """
+    Tests that a compiled template can be replaced many times with new objects.
+    """
+    jsoninja = Jsoninja()
+    template: Any = {
+        "id": 1,
+        "{{key}}": "{{name}}",
+        "info": {
+            "greeting": "Hello {{name}}!",
+            "tags": ["static", "{{tag}}", [True, None]],
+        },
+    }
+    compiled = jsoninja.compile(template)
+    first: Any = compiled.render({"key": "name", "name": "John", "tag": "a"})
+    second: Any = compiled.render({"key": "user", "name": "Jane", "tag": "b"})
+    assert first == {
+        "id": 1,
+        "name": "John",
+        "info": {
+            "greeting": "Hello John!",
+            "tags": ["static", "a", [True, None]],
+        },
+    }
+    assert second == {
+        "id": 1,
+        "user": "Jane",
+        "info": {
+            "greeting": "Hello Jane!",
+            "tags": ["static", "b", [True, None]],
+        },
+    }
+    assert first["info"] is not second["info"]
+    assert first["info"]["tags"][2] is not template["info"]["tags"][2]
+    assert template["{{key}}"] == "{{name}}"
+
+
+def test_compiled_function() -> None:
+    """
+    Tests that a generated function builds the template with the replaced values.
+    """
+    jsoninja = Jsoninja()
+    template: Any = {
+        "id": 1,
+        "ratio": 0.5,
+        "{{key}}": "{{name}}",
+        "quote": 'It\'s "static" {text}',
+        "pets": [{"name": "Qwerty", "type": "fish"}, "{{pet}}"],
+    }
+    render = jsoninja.compile_to_fn(template)
+    first: Any = render({"key": "name", "name": "John", "pet": lambda: "dog"})
+    second: Any = render({"key": "user", "name": "Jane", "pet": "cat"})
+    assert first == {
+        "id": 1,
+        "ratio": 0.5,
+        "name": "John",
+        "quote": 'It\'s "static" {text}',
+        "pets": [{"name": "Qwerty", "type": "fish"}, "dog"],
+    }
+    assert second == {
+        "id": 1,
+        "ratio": 0.5,
+        "user": "Jane",
+        "quote": 'It\'s "static" {text}',
+        "pets": [{"name": "Qwerty", "type": "fish"}, "cat"],
+    }
+    assert first["pets"][0] is not second["pets"][0]
+    assert first["pets"][0] is not template["pets"][0]
+
+
+def test_compiled_function_long_ints() -> None:
+    """
+    Tests that a function is generated for templates with ints too long to be
+    written as literals.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "x": 10**5000,
+        10**5000: "{{a}}",
+    }
+    replacements = {
+        "a": "b",
+    }
+    render = jsoninja.compile_to_fn(template)
+    assert render(replacements) == jsoninja.replace(template, replacements)
+
+
+def test_compiled_function_deep_template() -> None:
+    """
+    Tests that a function is generated for templates deeper than the parser allows.
+    """
+    jsoninja = Jsoninja()
+    template: List[Any] = ["{{foo}}"]
+    for _ in range(sys.getrecursionlimit() * 2):
+        template = [template]
+    render = jsoninja.compile_to_fn(template)
+    node: Any = render({"foo": "bar"})
+    while isinstance(node[0], list):
+        node = node[0]
+    assert node == ["bar"]
+    template = [{"{{id}}": "{{id}}"}]
+    for _ in range(sys.getrecursionlimit() * 2):
+        template = [template]
+    render = jsoninja.compile_to_fn(template)
+    node = render({"id": itertools.count(1).__next__})
+    while isinstance(node[0], list):
+        node = node[0]
+    assert node == [{1: 2}]
+
+
+def test_compiled_callback_order() -> None:
+    """
+    Tests that compiled templates call the callback functions in the same order as
+    replace, rendering each key before its value and nested nodes in place.
+    """
+    jsoninja = Jsoninja()
+    for template, expected in (
+        ({"a": "{{id}}", "b": ["{{id}}"], "c": "{{id}}"}, {"a": 1, "b": [2], "c": 3}),
+        ({"{{id}}": "{{id}}"}, {1: 2}),
+        (
+            [{"{{id}}": {"x": "{{id}}-{{id}}"}, "y": "{{id}}"}],
+            [{1: {"x": "2-3"}, "y": 4}],
+        ),
+    ):
+        results: List[Any] = []
+        for replace in (
+            jsoninja.replace,
+            lambda template, replacements: jsoninja.replace_inplace(
+                copy.deepcopy(template), replacements
+            ),
+            lambda template, replacements: jsoninja.compile(template).render(
+                replacements
+            ),
+            lambda template, replacements: jsoninja.compile_to_fn(template)(
+                replacements
+            ),
+        ):
+            replacements = {
+                "id": itertools.count(1).__next__,
+            }
+            results.append(replace(template, replacements))
+        assert results == [expected] * 4
+
+
+def test_compiled_embedded_variables() -> None:
+    """
+    Tests that compiled templates replace the variables embedded in text.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "label": "{{type1}}-{{ type2 }} {static}",
+        "digits": "{{1}}+{{type1}}",
+        "missing": "{{type1}} {{missing}}",
+    }
+    replacements = {
+        "type1": 1.5,
+        "type2": None,
+        "1": "one",
+    }
+    expected = {
+        "label": "1.5-None {static}",
+        "digits": "one+1.5",
+        "missing": "1.5 {{missing}}",
+    }
+    compiled = jsoninja.compile(template)
+    render = jsoninja.compile_to_fn(template, raise_on_missing=False)
+    assert compiled.render(replacements, raise_on_missing=False) == expected
+    assert render(replacements) == expected
+
+
+def test_compiled_missing_replacement() -> None:
+    """
+    Tests that compiled templates handle missing replacements like replace does.
+    """
+    jsoninja = Jsoninja()
+    template = {
+        "firstname": "{{ firstname }}",
+        "lastname": "{{lastname}}",
+    }
+    replacements = {
+        "firstname": "John",
+    }
+    compiled = jsoninja.compile(template)
+    with pytest.raises(KeyError) as exception:
+        compiled.render(replacements)
+    assert exception.value.args[0] == 'Unable to find a replacement for "lastname".'
+    with pytest.raises(KeyError):
+        jsoninja.compile_to_fn(template)(replacements)
+    expected = {
+        "firstname": "John",
+        "lastname": "{{lastname}}",
+    }
+    assert compiled.render(replacements, raise_on_missing=False) == expected
+    render = jsoninja.compile_to_fn(template, raise_on_missing=False)
+    assert render(replacements) == expected